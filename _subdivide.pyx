@@ -0,0 +1,100 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+Cython build of the `subdivide_all` kernel from `_subdivide_numba`, with the same arguments and results.
+
+Build it in place with `python setup.py build_ext --inplace`; `utils.subdivide_mesh` uses it
+automatically whenever it can be imported.
+"""
+from libc.math cimport floor, fmod, sqrt
+
+cdef unsigned long long HASH_MULTIPLIER = 0x9E3779B97F4A7C15ULL  # 2 ** 64 divided by the golden ratio
+
+
+cdef inline double _floordiv(double a, double b) noexcept nogil:
+    """Python's float `a // b` for positive `b`, which `floor(a / b)` does not always match."""
+    cdef double mod = fmod(a, b)
+    cdef double div = (a - mod) / b
+    cdef double result
+    if mod < 0:
+        div -= 1.0
+    result = floor(div)
+    if div - result > 0.5:
+        result += 1.0
+    return result
+
+
+cdef inline int _split_edge(double[:, ::1] coords, int *n_coords, long long[::1] edge_keys,
+                            int[::1] edge_vals, int hash_shift, int a, int b, double roughness,
+                            double[::1] noise) noexcept nogil:
+    """Returns the index of the vertex splitting the edge AB, creating it if needed."""
+    cdef long long key
+    cdef Py_ssize_t mask = edge_keys.shape[0] - 1
+    cdef Py_ssize_t slot
+    cdef int new_id
+    cdef double ax, ay, bx, by, dx, dy, norm, alpha, t
+
+    if a > b:
+        a, b = b, a
+    key = (<long long>a << 32) | b
+    slot = <Py_ssize_t>((<unsigned long long>key * HASH_MULTIPLIER) >> hash_shift)
+    while edge_keys[slot] != -1:
+        if edge_keys[slot] == key:
+            return edge_vals[slot]
+        slot = (slot + 1) & mask
+
+    new_id = n_coords[0]
+    ax, ay = coords[a, 0], coords[a, 1]
+    bx, by = coords[b, 0], coords[b, 1]
+    dx = bx - ax
+    dy = by - ay
+    norm = sqrt(dx * dx + dy * dy)
+    alpha = _floordiv(norm, 2.3) * roughness
+    if norm > 0:
+        t = noise[new_id] * alpha / norm
+    else:
+        t = 0.0  # Duplicate vertices are not displaced
+    coords[new_id, 0] = (ax + bx) * 0.5 - dy * t
+    coords[new_id, 1] = (ay + by) * 0.5 + dx * t
+
+    edge_keys[slot] = key
+    edge_vals[slot] = new_id
+    n_coords[0] = new_id + 1
+    return new_id
+
+
+def subdivide_all(double[:, ::1] coords, int n_coords, int[:, ::1] tris, Py_ssize_t n_tris, int depth,
+                  long long[::1] edge_keys, int[::1] edge_vals, double roughness, double[::1] noise):
+    """
+    Subdivides the first `n_tris` triangles of `tris` `depth` times, writing into preallocated arrays.
+    
+    See `_subdivide_numba.subdivide_all` for the meaning of each argument.
+    
+    Returns:
+        int: The number of vertices stored in `coords` after the subdivision.
+    """
+    cdef Py_ssize_t first = 0, end, t, out, capacity = 1
+    cdef int g, a, b, c, d, e, f, hash_shift = 64
+
+    while capacity < edge_keys.shape[0]:
+        capacity *= 2
+        hash_shift -= 1
+
+    with nogil:
+        for g in range(depth):
+            edge_keys[:] = -1  # Edges of different generations never coincide
+            end = first + n_tris
+            for t in range(first, first + n_tris):
+                a, b, c = tris[t, 0], tris[t, 1], tris[t, 2]
+                d = _split_edge(coords, &n_coords, edge_keys, edge_vals, hash_shift, a, b, roughness, noise)
+                e = _split_edge(coords, &n_coords, edge_keys, edge_vals, hash_shift, b, c, roughness, noise)
+                f = _split_edge(coords, &n_coords, edge_keys, edge_vals, hash_shift, a, c, roughness, noise)
+
+                # The triangle ABC becomes DBE, ADF, FEC and DEF.
+                out = end + 4 * (t - first)
+                tris[out, 0], tris[out, 1], tris[out, 2] = d, b, e
+                tris[out + 1, 0], tris[out + 1, 1], tris[out + 1, 2] = a, d, f
+                tris[out + 2, 0], tris[out + 2, 1], tris[out + 2, 2] = f, e, c
+                tris[out + 3, 0], tris[out + 3, 1], tris[out + 3, 2] = d, e, f
+            first = end
+            n_tris *= 4
+    return n_coords
@@ -0,0 +1,103 @@
+"""
+Numba build of the subdivision kernel used by `utils.subdivide_mesh` for large meshes.
+
+Kept in its own module so that importing `utils` does not import Numba: it is only loaded
+the first time a mesh is big enough to be worth compiling.
+"""
+import math
+import numpy as np
+from typing import Tuple
+from numba import njit
+
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)  # 2 ** 64 divided by the golden ratio
+
+@njit(cache=True)
+def _split_edge(coords: np.ndarray, n_coords: int, edge_keys: np.ndarray, edge_vals: np.ndarray,
+                hash_shift: np.uint64, a: int, b: int, roughness: float, noise: np.ndarray) -> Tuple[int, int]:
+    """
+    Returns the index of the vertex splitting the edge AB, creating it if the edge was not split yet.
+    
+    The edges already split are kept in an open-addressing hash table (`edge_keys`, `edge_vals`)
+    keyed by the sorted vertex index pair packed into a single int64, with -1 marking empty slots.
+    Its capacity is a power of two: keys are hashed by multiplying them by `_HASH_MULTIPLIER` and
+    keeping the top bits of the product (`hash_shift` is 64 minus the log2 of the capacity),
+    then probed linearly.
+    The new vertex is displaced by `noise[n_coords]`, a uniform sample in [-1, 1), times the
+    maximum displacement.
+    
+    Returns:
+        Tuple[int, int]: The index of the splitting vertex and the updated vertex count.
+    """
+    if a > b:
+        a, b = b, a
+    key = (np.int64(a) << 32) | b
+    mask = edge_keys.shape[0] - 1
+    slot = np.int64((np.uint64(key) * _HASH_MULTIPLIER) >> hash_shift)
+    while edge_keys[slot] != -1:
+        if edge_keys[slot] == key:
+            return edge_vals[slot], n_coords
+        slot = (slot + 1) & mask
+
+    ax, ay = coords[a, 0], coords[a, 1]
+    bx, by = coords[b, 0], coords[b, 1]
+    dx = bx - ax
+    dy = by - ay
+    norm = math.sqrt(dx * dx + dy * dy)
+    alpha = (norm // 2.3) * roughness
+    t = noise[n_coords] * alpha / norm if norm > 0 else 0.0  # Duplicate vertices are not displaced
+    coords[n_coords, 0] = (ax + bx) * 0.5 - dy * t
+    coords[n_coords, 1] = (ay + by) * 0.5 + dx * t
+
+    edge_keys[slot] = key
+    edge_vals[slot] = n_coords
+    return n_coords, n_coords + 1
+
+@njit(cache=True)
+def subdivide_all(coords: np.ndarray, n_coords: int, tris: np.ndarray, n_tris: int, depth: int,
+                  edge_keys: np.ndarray, edge_vals: np.ndarray, roughness: float, noise: np.ndarray) -> int:
+    """
+    Subdivides the first `n_tris` triangles of `tris` `depth` times, writing into preallocated arrays.
+    
+    Each generation is appended to `tris` right after the previous one, so the last generation
+    occupies the final `n_tris * 4 ** depth` rows.
+    
+    Args:
+        coords (np.ndarray): float64 vertex coordinates with room for every new vertex, shape (V, 2).
+        n_coords (int): The number of vertices already stored in `coords`.
+        tris (np.ndarray): int32 triangle vertex indices with room for every generation, shape (T, 3).
+        n_tris (int): The number of triangles already stored in `tris`.
+        depth (int): The number of subdivision passes.
+        edge_keys (np.ndarray): int64 hash table keys, with a power of two length larger than the
+            number of edges of one generation.
+        edge_vals (np.ndarray): int32 hash table values, same shape as `edge_keys`.
+        roughness (float): A factor that scales the random displacement along the perpendicular.
+        noise (np.ndarray): float64 uniform samples in [-1, 1), one per row of `coords`.
+    
+    Returns:
+        int: The number of vertices stored in `coords` after the subdivision.
+    """
+    hash_shift = np.uint64(64)
+    capacity = 1
+    while capacity < edge_keys.shape[0]:
+        capacity *= 2
+        hash_shift -= np.uint64(1)
+
+    first = 0
+    for _ in range(depth):
+        edge_keys[:] = -1  # Edges of different generations never coincide
+        end = first + n_tris
+        for t in range(first, first + n_tris):
+            a, b, c = tris[t, 0], tris[t, 1], tris[t, 2]
+            d, n_coords = _split_edge(coords, n_coords, edge_keys, edge_vals, hash_shift, a, b, roughness, noise)
+            e, n_coords = _split_edge(coords, n_coords, edge_keys, edge_vals, hash_shift, b, c, roughness, noise)
+            f, n_coords = _split_edge(coords, n_coords, edge_keys, edge_vals, hash_shift, a, c, roughness, noise)
+
+            # The triangle ABC becomes DBE, ADF, FEC and DEF.
+            out = end + 4 * (t - first)
+            tris[out, 0], tris[out, 1], tris[out, 2] = d, b, e
+            tris[out + 1, 0], tris[out + 1, 1], tris[out + 1, 2] = a, d, f
+            tris[out + 2, 0], tris[out + 2, 1], tris[out + 2, 2] = f, e, c
+            tris[out + 3, 0], tris[out + 3, 1], tris[out + 3, 2] = d, e, f
+        first = end
+        n_tris *= 4
+    return n_coords
@@ -0,0 +1,19 @@
+# Builds the optional Cython subdivision kernel used by utils.subdivide_mesh:
+#
+#     python setup.py build_ext --inplace
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="2d-terrain-generation",
+    ext_modules=cythonize(
+        "_subdivide.pyx",
+        compiler_directives={
+            "language_level": 3,
+            "boundscheck": False,
+            "wraparound": False,
+            "cdivision": True,
+        },
+    ),
+)
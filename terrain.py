@@ -3,11 +3,20 @@
 # Description: This program visualizes terrain generation. 
 # It initializes a single triangle and recursively subdivides it, displaying the results graphically.
 
+import numpy as np
 import pygame
-from utils import Node, Triangle, FIFO
+from utils import subdivide_mesh, draw_all
 
 def main():
     """Main function to setup and run the Pygame visualization loop."""
+    # Create the initial triangle as vertex coordinates and vertex indices
+    coords = np.array([[100, 600], [350, 200], [600, 600]], dtype=float)
+    tris = np.array([[0, 1, 2]], dtype=np.int32)
+
+    # Set the depth for triangle subdivisions, before Pygame and the display are initialized
+    depth = 6
+    coords, tris = subdivide_mesh(coords, tris, depth)
+
     pygame.init()  # Initialize Pygame
 
     # Define color constants
@@ -19,22 +28,10 @@ def main():
     screen = pygame.display.set_mode(screen_size)
     pygame.display.set_caption("Terrain Visualization")
 
-    # Create the initial triangle
-    A = Node(100, 600)
-    B = Node(350, 200)
-    C = Node(600, 600)
-    root_triangle = Triangle(A, B, C)
-
-    # Initialize the queue to manage triangles
-    queue = FIFO()
-    queue.enqueue(root_triangle)
-
-    # Set the depth for triangle subdivisions
-    depth = 6
-    for _ in range((4 ** depth - 1) // 3):
-        current_triangle = queue.dequeue()
-        triangles = current_triangle.subdivide()
-        queue.enqueue(triangles, is_list=True)
+    # The terrain never changes, so draw it once onto an off-screen surface
+    static_surf = pygame.Surface(screen_size)
+    static_surf.fill(WHITE)
+    draw_all(static_surf, np.rint(coords).astype(np.int16), tris, BLACK)  # Draw triangles with black color
 
     # Main loop control
     done = False
@@ -46,14 +43,8 @@ def main():
             if event.type == pygame.QUIT:
                 done = True
 
-        # Clear screen to white before drawing
-        screen.fill(WHITE)  
-
-        # Draw triangles
-        for _ in range(queue.size()):
-            current_triangle = queue.dequeue()
-            current_triangle.draw(screen, BLACK)  # Draw triangle with black color
-            queue.enqueue(current_triangle)  # Re-enqueue for continuous display
+        # Draw the pre-rendered triangles
+        screen.blit(static_surf, (0, 0))
 
         pygame.display.flip()  # Update display
         clock.tick(10)  # Control frame rate
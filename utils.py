@@ -1,22 +1,27 @@
-from typing import Set, Any, Optional, Callable, Dict, Tuple, List, Union
+from typing import Any, Optional, Callable, Dict, Iterable, Tuple, Union
+import contextlib
+import functools
+import itertools
+import math
+import multiprocessing
 import numpy as np
 import random
-from typing import Tuple
 from collections import deque
 import pygame
 
 #%%
+_node_id_counter = itertools.count(1)  # Contador de módulo para asignar el ID de cada Node
+
 class Node:
     """
-    Representa un nodo en una estructura de datos de red, con conexiones a otros nodos.
+    Representa un nodo (vértice) de la malla de triángulos.
     
     Attributes:
-        x (Any): Valor horizontal o atributo x del nodo.
-        y (Any): Valor vertical o atributo y del nodo.
-        connections (Set['Node']): Conjunto de nodos conectados a este nodo.
+        x (int): Coordenada horizontal del nodo, en píxeles.
+        y (int): Coordenada vertical del nodo, en píxeles.
         unique_id (int): Identificador único autoincremental para cada instancia de Node.
     """
-    _current_id = 0  # Variable de clase para rastrear el ID actual
+    __slots__ = ('x', 'y', 'unique_id')
 
     def __init__(self, x: Any, y: Any) -> None:
         """
@@ -26,190 +31,83 @@ class Node:
             x (Any): Valor horizontal o atributo x del nodo.
             y (Any): Valor vertical o atributo y del nodo.
         """
-        self.coordinates = np.array([x, y])
-        self.connections: Set['Node'] = set()
-        self.unique_id = self._get_unique_id()
-
-    @classmethod
-    def _get_unique_id(cls, reset: bool = False) -> int:
-        """
-        Obtiene un identificador único para la instancia, opcionalmente reseteando el contador.
-        
-        Args:
-            reset (bool): Si es True, resetea el contador de ID a cero.
-        
-        Returns:
-            int: El siguiente ID único para una nueva instancia de Node.
-        """
-        if reset:
-            cls._current_id = 0
-        else:
-            cls._current_id += 1
-        return cls._current_id
-
-    def add_connection(self, other_node: 'Node') -> None:
-        """
-        Establece una conexión bidireccional entre este nodo y otro, asegurando que no se añadan duplicados.
-        
-        Args:
-            other_node (Node): El nodo con el que se establecerá la conexión.
-        
-        Raises:
-            AssertionError: Si other_node es el mismo que self.
-        """
-        assert other_node is not self, "A node cannot connect to itself."
-        if other_node not in self.connections:
-            self.connections.add(other_node)
-            other_node.connections.add(self)
+        self.x, self.y = round(x), round(y)  # Píxeles enteros, listos para pygame.draw
+        self.unique_id = next(_node_id_counter)
 
-    def has_connection(self, other_node: 'Node') -> bool:
-        """
-        Verifica si existe una conexión con otro nodo.
-        
-        Args:
-            other_node (Node): El nodo para verificar si existe una conexión.
-        
-        Returns:
-            bool: True si existe la conexión, False de lo contrario.
-        """
-        return other_node in self.connections
-    
-    def remove_connection(self, other_node: 'Node') -> None:
-        """
-        Elimina la conexión bidireccional con otro nodo, si existe.
-        
-        Args:
-            other_node (Node): El nodo del cual se eliminará la conexión.
-        
-        Raises:
-            ValueError: Si el nodo especificado no está conectado.
-        """
-        if other_node in self.connections:
-            self.connections.remove(other_node)
-            other_node.connections.remove(self)
-        else:
-            raise ValueError("No connection exists with the specified node.")
-    
     def __str__(self) -> str:
         """
-        Proporciona una representación en forma de string del nodo, mostrando ID, coordenadas y conexiones.
+        Proporciona una representación en forma de string del nodo, mostrando ID y coordenadas.
         
         Returns:
             str: La representación en string del nodo.
         """
-        connection_ids = ', '.join(str(node.unique_id) for node in self.connections)
-        return (f"Node(ID: {self.unique_id}, Coordinates: {self.coordinates}, "
-                f"Connections: [{connection_ids}])")
-
-#%%
-def cache_nodes(verbose: bool = False) -> Callable:
-    """
-    A decorator that caches the results of a function based on its node arguments.
-    It assumes that each node argument has a unique attribute `unique_id`.
-
-    Args:
-        verbose (bool): If set to True, the decorator will print whether a cache hit
-                        or miss occurred.
-
-    Returns:
-        Callable: A wrapped function that uses caching to optimize calls.
-    """
-    def decorator(func: Callable) -> Callable:
-        cache: Dict[Tuple, Any] = {}
-        
-        def wrapper(*args, **kwargs) -> Any:
-            # Extract unique identifiers from node arguments.
-            nodes = [node.unique_id for node in [*args, *kwargs.values()]]
-            key = tuple(sorted(nodes))
-            
-            # Optionally print the cache key.
-            if verbose:
-                print(f"Cache key: {key}")
-            
-            # Check if result is cached and return it, otherwise compute and cache.
-            if key in cache:
-                if verbose:
-                    print('Cache hit.')
-                return cache[key]
-            else:
-                if verbose:
-                    print('Cache miss.')
-                result = func(*args, **kwargs)
-                cache[key] = result
-                return result
-        
-        return wrapper
-    
-    return decorator
+        return f"Node(ID: {self.unique_id}, Coordinates: ({self.x}, {self.y}))"
 
 #%%
-def random_perpendicular_point(start: np.ndarray, end: np.ndarray, roughtness: float = 0.3) -> np.ndarray:
+def random_perpendicular_point(ax: float, ay: float, bx: float, by: float,
+                               roughness: float = 0.3) -> Tuple[float, float]:
     """
-    Calculates a random point along the perpendicular bisector of the line segment defined by 'start' and 'end',
-    scaled by a 'scale' factor.
+    Calculates a random point along the perpendicular bisector of the line segment from (ax, ay) to (bx, by),
+    displaced by an amount proportional to the segment length.
     
     Args:
-        start (np.ndarray): The starting point of the line segment in 2D space.
-        end (np.ndarray): The ending point of the line segment in 2D space.
-        roughtness (float): A factor that scales the random displacement along the perpendicular.
+        ax (float): The x coordinate of the starting point of the line segment.
+        ay (float): The y coordinate of the starting point of the line segment.
+        bx (float): The x coordinate of the ending point of the line segment.
+        by (float): The y coordinate of the ending point of the line segment.
+        roughness (float): A factor that scales the random displacement along the perpendicular.
     
     Returns:
-        np.ndarray: The computed 2D point along the perpendicular bisector.
-    
-    Raises:
-        ValueError: If 'start' or 'end' are not 2-dimensional vectors.
-        ZeroDivisionError: If 'start' and 'end' are identical, resulting in a zero-length segment.
+        Tuple[float, float]: The computed 2D point along the perpendicular bisector.
     """
-    if start.shape != (2,) or end.shape != (2,):
-        raise ValueError("Both 'start' and 'end' must be 2-dimensional vectors.")
+    dx = bx - ax
+    dy = by - ay
+    norm = math.hypot(dx, dy)
+    if norm == 0:
+        # Nodes rounded to the same pixel: segments this short are never displaced anyway.
+        return float(ax), float(ay)
 
-    segment_vector = end - start
-    norm = np.linalg.norm(segment_vector)
-    try:
-        unit_segment_vector = segment_vector / norm
-    except ZeroDivisionError:
-        raise ZeroDivisionError("Cannot create a normal from a zero-length segment ('start' and 'end' are identical).")
+    # The segment rotated 90 degrees, (-dy, dx), is a normal of length `norm`,
+    # so the displacement is divided by it once instead of normalizing the vector.
+    alpha = (norm // 2.3) * roughness
+    t = random.uniform(-alpha, alpha) / norm
 
-    normal_vector = np.array([-unit_segment_vector[1], unit_segment_vector[0]])  # Rotate 90 degrees to get the normal
-    
-    alpha = (norm // 2.3) * roughtness
-    displacement = random.uniform(-alpha, alpha)
-    
-    
-    midpoint = (start + end) / 2
-    
-    return normal_vector * displacement + midpoint
+    return (ax + bx) * 0.5 - dy * t, (ay + by) * 0.5 + dx * t
 
 #%%
-@cache_nodes(verbose=False)
+# Nodes already created on each edge, keyed by the sorted unique_id pair of its endpoints
+# packed into a single int (smaller id in the high bits).
+_edge_cache: Dict[int, Node] = {}
+
 def create_new_node(node_a: Node, node_b: Node) -> Node:
     """
-    Creates a new node at a random position perpendicular to the line between two connected nodes,
-    modifies the connections to integrate the new node between them.
+    Creates a new node at a random position perpendicular to the line between two nodes.
+    The node is created only once per edge: later calls with the same pair of nodes,
+    in any order, return the same node.
 
     Args:
-        node_a (Node): The first node, connected to node_b.
-        node_b (Node): The second node, connected to node_a.
+        node_a (Node): The first endpoint of the edge.
+        node_b (Node): The second endpoint of the edge.
 
     Returns:
-        Node: The newly created node connected to node_a and node_b.
+        Node: The node splitting the edge between node_a and node_b.
 
     Raises:
-        AssertionError: If node_a and node_b are not connected.
-        ValueError: For geometric calculation errors or invalid node operations.
+        ValueError: For geometric calculation errors.
     """
-    if not node_a.has_connection(node_b):
-        raise ValueError("Nodes must be connected to create a new node between them.")
+    id_a, id_b = node_a.unique_id, node_b.unique_id
+    key = (id_a << 32) | id_b if id_a < id_b else (id_b << 32) | id_a
+    new_node = _edge_cache.get(key)
+    if new_node is not None:
+        return new_node
 
     try:
-        x, y = random_perpendicular_point(node_a.coordinates, node_b.coordinates)
-        new_node = Node(x, y)
-        new_node.add_connection(node_a)
-        new_node.add_connection(node_b)
-        node_a.remove_connection(node_b)
-        return new_node
+        x, y = random_perpendicular_point(node_a.x, node_a.y, node_b.x, node_b.y)
     except Exception as e:
         raise ValueError(f"An error occurred while creating a new node: {e}")
+    new_node = Node(x, y)
+    _edge_cache[key] = new_node
+    return new_node
 
 
 
@@ -226,21 +124,23 @@ class FIFO:
         """Inicializa una cola FIFO vacía."""
         self.items = deque()
 
-    def enqueue(self, item: Union[Any, List[Any]], is_list: bool = False) -> None:
+    def push(self, item: Any) -> None:
         """
-        Añade un elemento o una lista de elementos al final de la cola.
+        Añade un elemento al final de la cola.
         
-        Si el elemento es una lista y `is_list` es True, cada elemento de la lista
-        se añade individualmente a la cola. De lo contrario, el elemento completo se añade como uno solo.
+        Args:
+            item (Any): El elemento a ser añadido a la cola.
+        """
+        self.items.append(item)
+
+    def extend(self, items: Iterable[Any]) -> None:
+        """
+        Añade cada uno de los elementos dados al final de la cola, en orden.
         
         Args:
-            item (Union[Any, List[Any]]): El elemento o lista de elementos a ser añadidos a la cola.
-            is_list (bool): Indica si `item` es una lista de elementos.
+            items (Iterable[Any]): Los elementos a ser añadidos a la cola.
         """
-        if is_list and isinstance(item, list):
-            self.items.extend(item)  # Añade cada elemento de la lista a la cola
-        else:
-            self.items.append(item)  # Añade el elemento único a la cola
+        self.items.extend(items)
 
     def dequeue(self) -> Any:
         """
@@ -285,6 +185,8 @@ class FIFO:
   
 #%%
 class Triangle:
+    __slots__ = ('node_a', 'node_b', 'node_c')
+
     def __init__(self, node_a: Node, node_b: Node, node_c: Node): 
         """
         Initializes a Triangle with three nodes.
@@ -297,16 +199,6 @@ class Triangle:
         self.node_a = node_a
         self.node_b = node_b
         self.node_c = node_c
-    
-        self.create_edges()
-    
-    def create_edges(self) -> None:
-        """
-        Establishes bidirectional connections between the vertices of the triangle.
-        """
-        self.node_a.add_connection(self.node_b)
-        self.node_a.add_connection(self.node_c)
-        self.node_b.add_connection(self.node_c)
         
     def subdivide(self) -> Tuple['Triangle', 'Triangle', 'Triangle', 'Triangle']:
         """
@@ -336,9 +228,9 @@ class Triangle:
             color (Tuple[int, int, int]): The RGB color tuple for the triangle.
         """
         pygame.draw.polygon(screen, color, [
-            self.node_a.coordinates, 
-            self.node_b.coordinates, 
-            self.node_c.coordinates
+            (self.node_a.x, self.node_a.y),
+            (self.node_b.x, self.node_b.y),
+            (self.node_c.x, self.node_c.y)
         ], 1)
     
     def __str__(self) -> str:
@@ -346,3 +238,173 @@ class Triangle:
         Returns a string representation of the Triangle.
         """
         return f'Vertex 1: {self.node_a}, Vertex 2: {self.node_b}, Vertex 3: {self.node_c}'
+
+#%%
+def _edge_keys(tris: np.ndarray) -> np.ndarray:
+    """
+    Packs the edges AB, BC and AC of every triangle, in that order, as sorted vertex index pairs
+    stored in a single int64 (smaller index in the high 32 bits).
+    """
+    edges = np.concatenate([tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [0, 2]]]).astype(np.int64)
+    edges.sort(axis=1)
+    return (edges[:, 0] << 32) | edges[:, 1]
+
+#%%
+def _split_edges(coords: np.ndarray, keys: np.ndarray, roughness: float,
+                 rng: Union[np.random.Generator, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Displaces the midpoint of each distinct edge along its perpendicular.
+    
+    Args:
+        coords (np.ndarray): The vertex coordinates, with shape (N, 2).
+        keys (np.ndarray): Packed edge keys, as returned by `_edge_keys`, possibly repeated.
+        roughness (float): A factor that scales the random displacement along the perpendicular.
+        rng (Union[np.random.Generator, int]): The random generator, or a seed for a new one.
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The sorted distinct edge keys and the new point of each edge.
+    """
+    rng = np.random.default_rng(rng)
+    unique_keys = np.unique(keys)
+
+    start = coords[unique_keys >> 32]
+    end = coords[unique_keys & 0xFFFFFFFF]
+    segment = end - start
+    norm = np.linalg.norm(segment, axis=1, keepdims=True)
+    normal = np.stack([-segment[:, 1], segment[:, 0]], axis=1)  # Same length as the segment
+    alpha = (norm // 2.3) * roughness
+    # Zero-length edges (duplicate vertices) are not displaced, like in random_perpendicular_point.
+    scale = np.divide(rng.uniform(-alpha, alpha), norm, out=np.zeros_like(norm), where=norm > 0)
+    return unique_keys, (start + end) / 2 + normal * scale
+
+# Smallest generation, in triangles, split across worker processes when `processes` is given.
+# Starting the pool costs tens of milliseconds, far more than a whole depth 6 mesh (~1 ms).
+PARALLEL_MIN_TRIS = 4 ** 8
+
+# Smallest final mesh, in triangles, for which the compiled kernel beats the NumPy pass once
+# importing and loading it is counted. Measured from a root triangle: NumPy wins up to depth 9.
+COMPILED_MIN_TRIS = 4 ** 10
+
+@functools.lru_cache(maxsize=None)
+def _compiled_kernel() -> Optional[Callable]:
+    """
+    Imports the compiled `subdivide_all` kernel on first use: the Cython build if it was built
+    (see setup.py), otherwise the Numba one.
+    
+    Returns:
+        Optional[Callable]: The kernel, or None if neither Cython nor Numba is available.
+    """
+    try:
+        from _subdivide import subdivide_all
+    except ImportError:
+        try:
+            from _subdivide_numba import subdivide_all
+        except ImportError:
+            return None
+    return subdivide_all
+
+#%%
+def subdivide_mesh(coords: np.ndarray, tris: np.ndarray, depth: int, roughness: float = 0.3,
+                   rng: Optional[np.random.Generator] = None,
+                   processes: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Subdivides a triangle mesh `depth` times, processing a whole generation of triangles at once.
+    
+    Works like `Triangle.subdivide` and `create_new_node`, but on arrays of vertex coordinates and
+    triangle vertex indices instead of `Node` and `Triangle` objects. An edge shared by two
+    triangles is split only once, so both triangles get the same new vertex.
+    
+    Meshes of at least `COMPILED_MIN_TRIS` final triangles go to the compiled `subdivide_all`
+    kernel when the Cython extension is built or Numba is installed. Otherwise each generation
+    is processed with vectorized NumPy operations, split across `processes` worker processes
+    once it has at least `PARALLEL_MIN_TRIS` triangles.
+    
+    Args:
+        coords (np.ndarray): The vertex coordinates, with shape (N, 2).
+        tris (np.ndarray): The vertex indices of each triangle, with shape (M, 3).
+        depth (int): The number of subdivision passes.
+        roughness (float): A factor that scales the random displacement along the perpendicular.
+        rng (Optional[np.random.Generator]): The random generator used for the displacements.
+        processes (Optional[int]): The number of worker processes for the NumPy pass of large
+            meshes; serial if None.
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The subdivided vertex coordinates and triangle vertex indices.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    coords = np.asarray(coords, dtype=np.float64)
+    tris = np.asarray(tris, dtype=np.int32)
+
+    kernel = _compiled_kernel() if len(tris) * 4 ** depth >= COMPILED_MIN_TRIS else None
+    if kernel is not None:
+        # Each generation has at most three new vertices and exactly four triangles per triangle.
+        n_tris = len(tris) * 4 ** depth
+        all_coords = np.empty((len(coords) + sum(3 * len(tris) * 4 ** g for g in range(depth)), 2))
+        all_coords[:len(coords)] = coords
+        all_tris = np.empty((len(tris) * sum(4 ** g for g in range(depth + 1)), 3), dtype=np.int32)
+        all_tris[:len(tris)] = tris
+        # Hash table with at least twice as many slots as the edges of the last generation.
+        edge_keys = np.empty(1 << max(6 * n_tris // 4 - 1, 1).bit_length(), dtype=np.int64)
+        edge_vals = np.empty(len(edge_keys), dtype=np.int32)
+        # Draw every displacement in one call instead of one scalar draw per edge.
+        noise = rng.uniform(-1, 1, size=len(all_coords))
+        n_coords = kernel(all_coords, len(coords), all_tris, len(tris), depth,
+                          edge_keys, edge_vals, roughness, noise)
+        return all_coords[:n_coords], all_tris[-n_tris:]
+
+    parallel = processes is not None and processes > 1 and depth > 0 \
+        and len(tris) * 4 ** (depth - 1) >= PARALLEL_MIN_TRIS
+    with (multiprocessing.Pool(processes) if parallel else contextlib.nullcontext()) as pool:
+        for _ in range(depth):
+            keys = _edge_keys(tris)
+            if pool is not None and len(tris) >= PARALLEL_MIN_TRIS:
+                # Each worker splits the edges of its own block of triangles. An edge on the border
+                # between two blocks is split twice: keep the first block's point, deterministically.
+                blocks = [block.ravel() for block in np.array_split(keys.reshape(3, -1), processes, axis=1)]
+                seeds = rng.integers(2 ** 63, size=len(blocks))
+                results = pool.starmap(_split_edges, [(coords, block, roughness, seed)
+                                                      for block, seed in zip(blocks, seeds)])
+                unique_keys, first = np.unique(np.concatenate([k for k, _ in results]), return_index=True)
+                midpoints = np.concatenate([m for _, m in results])[first]
+            else:
+                unique_keys, midpoints = _split_edges(coords, keys, roughness, rng)
+
+            # Each triangle ABC becomes DBE, ADF, FEC and DEF.
+            new_ids = np.arange(len(coords), len(coords) + len(unique_keys), dtype=np.int32)
+            d, e, f = new_ids[np.searchsorted(unique_keys, keys)].reshape(3, -1)
+            a, b, c = tris.T
+            tris = np.stack([d, b, e, a, d, f, f, e, c, d, e, f], axis=1).reshape(-1, 3)
+            coords = np.concatenate([coords, midpoints])
+
+    return coords, tris
+
+#%%
+def mesh_edges(tris: np.ndarray) -> np.ndarray:
+    """
+    Lists every distinct edge of a triangle mesh once, even when it is shared by two triangles.
+    
+    Args:
+        tris (np.ndarray): The vertex indices of each triangle, with shape (M, 3).
+    
+    Returns:
+        np.ndarray: The vertex index pairs of the edges, with shape (E, 2).
+    """
+    keys = np.unique(_edge_keys(tris))
+    return np.stack([keys >> 32, keys & 0xFFFFFFFF], axis=1)
+
+#%%
+def draw_all(screen: Any, coords_int: np.ndarray, tris_idx: np.ndarray, color: Tuple[int, int, int]) -> None:
+    """
+    Draws a triangle mesh stored as index arrays on a Pygame surface, one line per distinct edge.
+    
+    Args:
+        screen (Any): The Pygame surface where the mesh will be drawn.
+        coords_int (np.ndarray): The integer pixel coordinates of the vertices, with shape (N, 2).
+        tris_idx (np.ndarray): The vertex indices of each triangle, with shape (M, 3).
+        color (Tuple[int, int, int]): The RGB color tuple for the edges.
+    """
+    points = coords_int.tolist()
+    for a, b in mesh_edges(tris_idx).tolist():
+        pygame.draw.line(screen, color, points[a], points[b])